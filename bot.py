@@ -5,182 +5,499 @@ Receives webhook signals from TradingView and sends notifications to Telegram ch
 """
 
 import os
+import json
+import hmac
+import html
+import hashlib
+import time
+import atexit
 import logging
+import logging.handlers
+from queue import SimpleQueue
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict, Optional
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import uvicorn
-from telegram import Bot
-from telegram.error import TelegramError
+import orjson
+import httpx
 import asyncio
-
-# Configure logging
+from aiolimiter import AsyncLimiter
+
+# Configure logging; handlers run in a background thread so disk writes
+# never block the event loop
+_log_queue: SimpleQueue = SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.FileHandler('logs/bot.log'),
+    logging.StreamHandler()
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/bot.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
+# httpx logs request URLs, which contain the bot token
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 # Initialize FastAPI app
-app = FastAPI(title="TradingView Telegram Bot")
+app = FastAPI(title="TradingView Telegram Bot", default_response_class=ORJSONResponse)
 
 # Configuration from environment variables
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
 TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID', '')
 WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', 'your-secret-key')
 
-# Initialize Telegram Bot
-telegram_bot: Optional[Bot] = None
+# Expected Authorization header, built once for constant-time comparison
+_EXPECTED_AUTH = f"Bearer {WEBHOOK_SECRET}".encode()
+
+# Shared HTTP session for the Telegram Bot API
+TELEGRAM_API_URL = "https://api.telegram.org"
+http_client: Optional[httpx.AsyncClient] = None
+
+
+@dataclass(slots=True)
+class PositionState:
+    """Tracked position for a single symbol"""
+    status: str
+    entry_time: str
+    entry_price: float
+    direction: str
+    tp_price: float = 0.0
+    sl_price: float = 0.0
+
+
+# Track position states per symbol, least recently used first
+MAX_POSITIONS = 10_000
+position_states: OrderedDict[str, PositionState] = OrderedDict()
+
+# Webhook bodies at least this big are parsed in a worker thread
+LARGE_PAYLOAD_SIZE = 64 * 1024
+
+# Digests of recently processed webhook bodies for retry dedup
+SEEN_WEBHOOKS_SIZE = 2048
+_seen_webhooks: OrderedDict[bytes, None] = OrderedDict()
+
+
+def store_position(symbol: str, state: PositionState):
+    """Save position state, evicting the least recently used one when full"""
+    if symbol in position_states:
+        position_states.move_to_end(symbol)
+    position_states[symbol] = state
+    if len(position_states) > MAX_POSITIONS:
+        evicted, _ = position_states.popitem(last=False)
+        logger.warning("Position limit reached, dropped state for %s", evicted)
+
+
+# Outgoing Telegram messages waiting for the background workers
+TELEGRAM_QUEUE_SIZE = 1000
+TELEGRAM_SYMBOL_QUEUE_SIZE = 128
+# Upper bound for parallel sends, also the size of the HTTP connection pool
+TELEGRAM_MAX_CONCURRENCY = 32
+TELEGRAM_WORKER_COUNT = max(1, min(int(os.getenv('TELEGRAM_WORKER_COUNT', 5)), TELEGRAM_MAX_CONCURRENCY))
+TELEGRAM_SHUTDOWN_TIMEOUT = 10
+
+# Coalesce messages that arrive close together into one Telegram post
+TELEGRAM_BATCH_SIZE = 5
+TELEGRAM_BATCH_WINDOW = 0.2
+TELEGRAM_MESSAGE_LIMIT = 4096
+BATCH_SEPARATOR = "\n\n━━━\n\n"
+
+
+class FairQueue:
+    """Per-symbol message queues served round-robin so no symbol starves others"""
+
+    def __init__(self, maxsize: int, maxsize_per_key: int):
+        self._maxsize = maxsize
+        self._maxsize_per_key = maxsize_per_key
+        self._queues: Dict[str, deque] = {}
+        self._active: deque = deque()
+        self._size = 0
+        # One token per queued item, so getters wait cancellation-safely
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def put_nowait(self, key: str, item: str):
+        if self._size >= self._maxsize:
+            raise asyncio.QueueFull
+        items = self._queues.get(key)
+        if items is None:
+            items = self._queues[key] = deque()
+            self._active.append(key)
+        elif len(items) >= self._maxsize_per_key:
+            raise asyncio.QueueFull
+        items.append(item)
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._ready.put_nowait(None)
+
+    async def get(self) -> str:
+        await self._ready.get()
+        key = self._active.popleft()
+        items = self._queues[key]
+        item = items.popleft()
+        if items:
+            self._active.append(key)
+        else:
+            del self._queues[key]
+        self._size -= 1
+        return item
+
+    def task_done(self):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+
+class AdmissionController:
+    """Concurrency limit for Telegram sends that can be resized at runtime"""
+
+    def __init__(self, limit: int):
+        self._check_limit(limit)
+        self._cond = asyncio.Condition()
+        self._active = 0
+        self._limit = limit
+
+    @staticmethod
+    def _check_limit(limit: int):
+        # A limit below 1 would block every acquire() forever
+        if limit < 1:
+            raise ValueError(f"Concurrency limit must be at least 1, got {limit}")
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+
+    async def release(self):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify(1)
+
+    async def set_limit(self, limit: int):
+        self._check_limit(limit)
+        async with self._cond:
+            self._limit = limit
+            self._cond.notify_all()
+
+
+# Bound the number of in-flight Telegram requests
+send_admission = AdmissionController(TELEGRAM_WORKER_COUNT)
 
-# Track position states per symbol
-position_states: Dict[str, Dict] = {}
+# Telegram rate limits: ~1 msg/sec per chat, ~30 msg/sec globally
+_global_limiter = AsyncLimiter(28, 1)
+_chat_limiters: Dict[str, AsyncLimiter] = {}
 
 
 def init_telegram_bot():
-    """Initialize Telegram bot instance"""
-    global telegram_bot
+    """Initialize persistent HTTP client for the Telegram Bot API"""
+    global http_client
     if not TELEGRAM_BOT_TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN not set!")
         return False
     
     try:
-        telegram_bot = Bot(token=TELEGRAM_BOT_TOKEN)
+        http_client = httpx.AsyncClient(
+            base_url=TELEGRAM_API_URL,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=TELEGRAM_MAX_CONCURRENCY,
+                max_keepalive_connections=TELEGRAM_MAX_CONCURRENCY
+            ),
+            timeout=httpx.Timeout(5.0, connect=2.0, pool=1.0)
+        )
         logger.info("Telegram bot initialized successfully")
         return True
     except Exception as e:
-        logger.error(f"Failed to initialize Telegram bot: {e}")
+        logger.error("Failed to initialize Telegram bot: %s", e)
         return False
 
 
-async def send_telegram_message(message: str, parse_mode: str = 'HTML') -> bool:
-    """Send message to Telegram channel"""
-    if not telegram_bot:
+async def post_telegram_message(message: str, parse_mode: str = 'HTML') -> Optional[Dict]:
+    """Send message to Telegram channel, returning the Bot API reply
+
+    Returns None when no reply was received (bot not initialized or the
+    request failed in transport), in which case the message may or may not
+    have been posted.
+    """
+    if not http_client:
         logger.error("Telegram bot not initialized")
-        return False
+        return None
     
+    chat_limiter = _chat_limiters.get(TELEGRAM_CHANNEL_ID)
+    if chat_limiter is None:
+        chat_limiter = _chat_limiters[TELEGRAM_CHANNEL_ID] = AsyncLimiter(1, 1)
     try:
-        await telegram_bot.send_message(
-            chat_id=TELEGRAM_CHANNEL_ID,
-            text=message,
-            parse_mode=parse_mode
-        )
-        logger.info(f"Message sent to Telegram channel {TELEGRAM_CHANNEL_ID}")
-        return True
-    except TelegramError as e:
-        logger.error(f"Failed to send Telegram message: {e}")
-        return False
+        async with _global_limiter, chat_limiter:
+            await send_admission.acquire()
+            try:
+                response = await http_client.post(
+                    f"/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
+                    json={
+                        "chat_id": TELEGRAM_CHANNEL_ID,
+                        "text": message,
+                        "parse_mode": parse_mode
+                    }
+                )
+            finally:
+                await send_admission.release()
+        result = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        logger.error("Failed to send Telegram message: %s", e)
+        return None
+    
+    if result.get('ok'):
+        logger.info("Message sent to Telegram channel %s", TELEGRAM_CHANNEL_ID)
+    else:
+        logger.error("Failed to send Telegram message: %s", result.get('description'))
+    return result
 
 
-def format_entry_signal(data: Dict) -> str:
-    """Format entry signal notification"""
-    signal_type = data.get('signal_type', 'unknown')
-    direction = "🟢 LONG" if 'long' in signal_type.lower() else "🔴 SHORT"
-    
-    symbol = data.get('symbol', 'UNKNOWN')
-    timeframe = data.get('timeframe', '7m')
-    price = data.get('price', 0)
-    momentum = data.get('momentum', 0)
-    vwap = data.get('vwap', 0)
-    timestamp = data.get('timestamp', datetime.utcnow().isoformat())
-    
-    message = f"""
+async def send_telegram_message(message: str, parse_mode: str = 'HTML') -> bool:
+    """Send message to Telegram channel"""
+    result = await post_telegram_message(message, parse_mode)
+    return bool(result and result.get('ok'))
+
+
+async def telegram_worker(worker_id: int):
+    """Drain the outgoing queue and deliver batched messages to Telegram"""
+    queue: FairQueue = app.state.tg_queue
+    loop = asyncio.get_running_loop()
+    pending: Optional[str] = None
+    while True:
+        batch = [pending if pending is not None else await queue.get()]
+        pending = None
+        length = len(batch[0])
+        
+        # Collect more messages until the batch window closes
+        deadline = loop.time() + TELEGRAM_BATCH_WINDOW
+        while len(batch) < TELEGRAM_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            length += len(BATCH_SEPARATOR) + len(message)
+            if length > TELEGRAM_MESSAGE_LIMIT:
+                # Does not fit into this post, send it with the next batch
+                pending = message
+                break
+            batch.append(message)
+        
+        try:
+            result = await post_telegram_message(BATCH_SEPARATOR.join(batch))
+            # Only a 400 means Telegram refused the content; after timeouts the
+            # batch may already be posted and a 429 must not be answered with
+            # more requests, so those are not split
+            if result and result.get('error_code') == 400 and len(batch) > 1:
+                # Don't let one rejected message take the rest of the batch down
+                logger.warning("Telegram worker %d retrying batch of %d one by one", worker_id, len(batch))
+                for message in batch:
+                    await send_telegram_message(message)
+        except Exception as e:
+            logger.error("Telegram worker %d failed to send message: %s", worker_id, e, exc_info=True)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+def parse_payload(body: bytes):
+    """Decode webhook JSON body"""
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError:
+        # Unlike the stdlib, orjson rejects NaN/Infinity, which TradingView
+        # renders for unquoted plot values that are `na`
+        return json.loads(body)
+
+
+def verify_webhook_secret(request: Request):
+    """Reject requests without the expected bearer token"""
+    auth_header = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth_header.encode('latin-1'), _EXPECTED_AUTH):
+        logger.warning("Unauthorized webhook attempt")
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+def remember_webhook(key: bytes):
+    """Record processed webhook key, forgetting the oldest when full"""
+    _seen_webhooks[key] = None
+    if len(_seen_webhooks) > SEEN_WEBHOOKS_SIZE:
+        _seen_webhooks.popitem(last=False)
+
+
+def enqueue_telegram_message(symbol: str, message: str):
+    """Queue message for background delivery without waiting on Telegram"""
+    try:
+        app.state.tg_queue.put_nowait(symbol, message)
+    except asyncio.QueueFull:
+        logger.error("Telegram queue is full, dropping webhook for %s", symbol)
+        raise HTTPException(status_code=503, detail="Telegram queue is full")
+
+
+# Last generated timestamp as [monotonic time, ISO string]
+_now_cache = [float('-inf'), '']
+
+
+def _now_iso() -> str:
+    """Current UTC time in ISO format, regenerated at most once per second"""
+    now = time.monotonic()
+    if now - _now_cache[0] >= 1:
+        _now_cache[0] = now
+        _now_cache[1] = datetime.utcnow().isoformat()
+    return _now_cache[1]
+
+
+# Supported signal types mapped to (kind, direction)
+_SIGNAL_KINDS = {
+    'entry_long': ('entry', 'LONG'),
+    'entry_short': ('entry', 'SHORT'),
+    'exit_long': ('exit', 'LONG'),
+    'exit_short': ('exit', 'SHORT'),
+    'update': ('update', None),
+}
+
+# Message labels per direction and update type
+_DIR = {'LONG': "🟢 LONG", 'SHORT': "🔴 SHORT"}
+_DIR_EMOJI = {'LONG': "🟢", 'SHORT': "🔴"}
+_UPDATE_EMOJI = {'warning': "⚠️", 'success': "✅", 'error': "❌"}
+_MOMENTUM_NOTE = ('(выше +5.1)', '(ниже -5.1)')
+
+# Bound number formatters for message fields
+_F6 = "{:.6f}".format
+_F2 = "{:.2f}".format
+
+
+def _escape(value) -> str:
+    """Escape payload text for messages sent with parse_mode HTML"""
+    return html.escape(str(value))
+
+
+TEMPLATE_ENTRY = """\
 {direction} ВХОД В ПОЗИЦИЮ
 
 <b>Символ:</b> {symbol}
 <b>Таймфрейм:</b> {timeframe}
-<b>Цена:</b> ${price:.6f}
+<b>Цена:</b> ${price}
 
 📊 <b>Индикаторы:</b>
-• Momentum: {momentum:.2f} {'(ниже -5.1)' if momentum < -5.1 else '(выше +5.1)'}
-• VWAP: ${vwap:.6f}
+• Momentum: {momentum} {momentum_note}
+• VWAP: ${vwap}
 
 ⏰ <b>Время:</b> {timestamp}
 
-<i>Начат набор позиции. Ожидайте уведомление с TP/SL...</i>
-"""
-    return message.strip()
+<i>Начат набор позиции. Ожидайте уведомление с TP/SL...</i>"""
+
+TEMPLATE_EXIT = """\
+{direction_emoji} ПАРАМЕТРЫ ПОЗИЦИИ
+
+<b>Символ:</b> {symbol}
+<b>Направление:</b> {direction}
+<b>Статус:</b> Набор позиции завершён
+
+🎯 <b>Take Profit:</b> ${tp_price} (VWAP)
+🛡 <b>Stop Loss:</b> ${sl_price} (ATR)
+
+📊 <b>Анализ:</b>
+• Momentum: {momentum} (вышел из зоны)
+• Risk/Reward: 1:{rr_ratio}
+• Плечо: 5x
+
+⏰ <b>Время:</b> {timestamp}"""
+
+TEMPLATE_UPDATE = """\
+{emoji} ОБНОВЛЕНИЕ ПОЗИЦИИ
+
+<b>Символ:</b> {symbol}
+<b>Цена:</b> ${price}
+
+{message_text}
+
+⏰ <b>Время:</b> {timestamp}"""
+
+
+def format_entry_signal(data: Dict, direction: str) -> str:
+    """Format entry signal notification"""
+    momentum = data.get('momentum', 0)
+    
+    return TEMPLATE_ENTRY.format_map({
+        'direction': _DIR[direction],
+        'symbol': _escape(data.get('symbol', 'UNKNOWN')),
+        'timeframe': _escape(data.get('timeframe', '7m')),
+        'price': _F6(data.get('price', 0)),
+        'momentum': _F2(momentum),
+        'momentum_note': _MOMENTUM_NOTE[momentum < -5.1],
+        'vwap': _F6(data.get('vwap', 0)),
+        'timestamp': _escape(data.get('timestamp') or _now_iso()),
+    })
 
 
 def format_exit_signal(data: Dict) -> str:
     """Format exit signal with TP/SL notification"""
-    symbol = data.get('symbol', 'UNKNOWN')
-    direction = data.get('direction', 'LONG')
+    direction = str(data.get('direction', 'LONG')).upper()
     entry_price = data.get('entry_price', 0)
     tp_price = data.get('tp_price', 0)
     sl_price = data.get('sl_price', 0)
-    momentum = data.get('momentum', 0)
-    timestamp = data.get('timestamp', datetime.utcnow().isoformat())
     
     # Calculate risk/reward ratio
-    if direction.upper() == 'LONG':
+    if direction == 'LONG':
         risk = abs(entry_price - sl_price)
         reward = abs(tp_price - entry_price)
     else:
         risk = abs(sl_price - entry_price)
         reward = abs(entry_price - tp_price)
     
-    rr_ratio = reward / risk if risk > 0 else 0
-    
-    direction_emoji = "🟢" if direction.upper() == 'LONG' else "🔴"
-    
-    message = f"""
-{direction_emoji} ПАРАМЕТРЫ ПОЗИЦИИ
-
-<b>Символ:</b> {symbol}
-<b>Направление:</b> {direction.upper()}
-<b>Статус:</b> Набор позиции завершён
-
-🎯 <b>Take Profit:</b> ${tp_price:.6f} (VWAP)
-🛡 <b>Stop Loss:</b> ${sl_price:.6f} (ATR)
-
-📊 <b>Анализ:</b>
-• Momentum: {momentum:.2f} (вышел из зоны)
-• Risk/Reward: 1:{rr_ratio:.2f}
-• Плечо: 5x
-
-⏰ <b>Время:</b> {timestamp}
-"""
-    return message.strip()
+    return TEMPLATE_EXIT.format_map({
+        'direction_emoji': _DIR_EMOJI.get(direction, "🔴"),
+        'symbol': _escape(data.get('symbol', 'UNKNOWN')),
+        'direction': _escape(direction),
+        'tp_price': _F6(tp_price),
+        'sl_price': _F6(sl_price),
+        'momentum': _F2(data.get('momentum', 0)),
+        'rr_ratio': _F2(reward / risk if risk > 0 else 0),
+        'timestamp': _escape(data.get('timestamp') or _now_iso()),
+    })
 
 
 def format_update_signal(data: Dict) -> str:
     """Format position update notification"""
-    symbol = data.get('symbol', 'UNKNOWN')
-    update_type = data.get('update_type', 'info')
-    message_text = data.get('message', '')
-    price = data.get('price', 0)
-    timestamp = data.get('timestamp', datetime.utcnow().isoformat())
-    
-    emoji = "ℹ️"
-    if update_type == 'warning':
-        emoji = "⚠️"
-    elif update_type == 'success':
-        emoji = "✅"
-    elif update_type == 'error':
-        emoji = "❌"
-    
-    message = f"""
-{emoji} ОБНОВЛЕНИЕ ПОЗИЦИИ
-
-<b>Символ:</b> {symbol}
-<b>Цена:</b> ${price:.6f}
-
-{message_text}
-
-⏰ <b>Время:</b> {timestamp}
-"""
-    return message.strip()
+    return TEMPLATE_UPDATE.format_map({
+        'emoji': _UPDATE_EMOJI.get(data.get('update_type'), "ℹ️"),
+        'symbol': _escape(data.get('symbol', 'UNKNOWN')),
+        'price': _F6(data.get('price', 0)),
+        'message_text': _escape(data.get('message', '')),
+        'timestamp': _escape(data.get('timestamp') or _now_iso()),
+    })
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize bot on startup"""
     logger.info("Starting TradingView Telegram Bot...")
+    app.state.tg_queue = FairQueue(TELEGRAM_QUEUE_SIZE, TELEGRAM_SYMBOL_QUEUE_SIZE)
+    app.state.tg_workers = [
+        asyncio.create_task(telegram_worker(i)) for i in range(TELEGRAM_WORKER_COUNT)
+    ]
     if init_telegram_bot():
         logger.info("Bot initialized successfully")
         # Send startup notification
@@ -189,11 +506,27 @@ async def startup_event():
                 "🤖 <b>Бот запущен</b>\n\nМониторинг сигналов TradingView активирован."
             )
         except Exception as e:
-            logger.error(f"Failed to send startup message: {e}")
+            logger.error("Failed to send startup message: %s", e)
     else:
         logger.error("Failed to initialize bot")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending Telegram messages and stop background workers"""
+    try:
+        await asyncio.wait_for(app.state.tg_queue.join(), TELEGRAM_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Timed out flushing Telegram queue on shutdown")
+    
+    for worker in app.state.tg_workers:
+        worker.cancel()
+    await asyncio.gather(*app.state.tg_workers, return_exceptions=True)
+    
+    if http_client:
+        await http_client.aclose()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -207,7 +540,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
-    bot_status = "ok" if telegram_bot else "error"
+    bot_status = "ok" if http_client else "error"
     return {
         "status": "healthy",
         "telegram_bot": bot_status,
@@ -220,67 +553,115 @@ async def webhook_handler(request: Request):
     """Handle incoming webhooks from TradingView"""
     try:
         # Verify webhook secret
-        auth_header = request.headers.get('Authorization', '')
-        if auth_header != f"Bearer {WEBHOOK_SECRET}":
-            logger.warning("Unauthorized webhook attempt")
-            raise HTTPException(status_code=401, detail="Unauthorized")
+        verify_webhook_secret(request)
         
         # Parse webhook payload
-        payload = await request.json()
-        logger.info(f"Received webhook: {payload}")
+        body = await request.body()
+        if len(body) < LARGE_PAYLOAD_SIZE:
+            payload = parse_payload(body)
+        else:
+            # Keep large payloads from stalling the event loop while parsing
+            payload = await asyncio.get_running_loop().run_in_executor(None, parse_payload, body)
+        logger.info("Received webhook: %s", payload)
         
         # Extract signal information
         signal_type = payload.get('signal_type', '')
         symbol = payload.get('symbol', '')
         
+        # Drop TradingView retries, which resend the exact same body
+        timestamp = payload.get('timestamp')
+        dedup_key = hashlib.blake2b(body, digest_size=16).digest() if timestamp else None
+        if dedup_key in _seen_webhooks:
+            logger.info("Duplicate webhook ignored: %s %s %s", symbol, signal_type, timestamp)
+            return ORJSONResponse(
+                status_code=200,
+                content={"status": "duplicate", "message": "Webhook already processed"}
+            )
+        
         # Process signal based on type
-        if 'entry' in signal_type.lower():
+        kind, direction = _SIGNAL_KINDS.get(signal_type, (None, None))
+        if kind == 'entry':
             # Entry signal - start position accumulation
-            message = format_entry_signal(payload)
-            await send_telegram_message(message)
+            message = format_entry_signal(payload, direction)
+            enqueue_telegram_message(symbol, message)
             
             # Store position state
-            position_states[symbol] = {
-                'status': 'accumulating',
-                'entry_time': datetime.utcnow().isoformat(),
-                'entry_price': payload.get('price', 0),
-                'direction': 'LONG' if 'long' in signal_type.lower() else 'SHORT'
-            }
+            store_position(symbol, PositionState(
+                status='accumulating',
+                entry_time=datetime.utcnow().isoformat(),
+                entry_price=payload.get('price', 0),
+                direction=direction
+            ))
             
-        elif 'exit' in signal_type.lower():
+        elif kind == 'exit':
             # Exit signal - position accumulated, send TP/SL
-            if symbol in position_states:
+            state = position_states.get(symbol)
+            if state is not None:
+                position_states.move_to_end(symbol)
                 # Merge position state with payload
-                payload['direction'] = position_states[symbol].get('direction', 'LONG')
-                payload['entry_price'] = position_states[symbol].get('entry_price', 0)
+                payload['direction'] = state.direction
+                payload['entry_price'] = state.entry_price
+            else:
+                payload.setdefault('direction', direction)
             
             message = format_exit_signal(payload)
-            await send_telegram_message(message)
+            enqueue_telegram_message(symbol, message)
             
             # Update position state
-            if symbol in position_states:
-                position_states[symbol]['status'] = 'active'
-                position_states[symbol]['tp_price'] = payload.get('tp_price', 0)
-                position_states[symbol]['sl_price'] = payload.get('sl_price', 0)
+            if state is not None:
+                state.status = 'active'
+                state.tp_price = payload.get('tp_price', 0)
+                state.sl_price = payload.get('sl_price', 0)
         
-        elif 'update' in signal_type.lower():
+        elif kind == 'update':
             # General update notification
             message = format_update_signal(payload)
-            await send_telegram_message(message)
+            enqueue_telegram_message(symbol, message)
         
         else:
-            logger.warning(f"Unknown signal type: {signal_type}")
+            logger.warning("Unknown signal type: %s", signal_type)
         
-        return JSONResponse(
+        if dedup_key:
+            remember_webhook(dedup_key)
+        
+        return ORJSONResponse(
             status_code=200,
             content={"status": "success", "message": "Webhook processed"}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing webhook: {e}", exc_info=True)
+        logger.error("Error processing webhook: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/concurrency")
+async def set_concurrency(request: Request):
+    """Change the number of parallel Telegram sends without a restart"""
+    verify_webhook_secret(request)
+    
+    try:
+        limit = orjson.loads(await request.body()).get('limit')
+    except (orjson.JSONDecodeError, AttributeError):
+        limit = None
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= TELEGRAM_MAX_CONCURRENCY:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be an integer between 1 and {TELEGRAM_MAX_CONCURRENCY}"
+        )
+    
+    await send_admission.set_limit(limit)
+    
+    # Make sure enough workers exist to use the new limit
+    workers = app.state.tg_workers
+    while len(workers) < limit:
+        workers.append(asyncio.create_task(telegram_worker(len(workers))))
+    
+    logger.info("Telegram send concurrency set to %d", limit)
+    return {"status": "success", "limit": limit}
+
+
 @app.post("/test")
 async def test_notification():
     """Test endpoint to send a test notification"""
@@ -290,7 +671,7 @@ async def test_notification():
 Бот работает корректно и готов принимать сигналы от TradingView.
 
 ⏰ {time}
-""".format(time=datetime.utcnow().isoformat())
+""".format(time=_now_iso())
     
     success = await send_telegram_message(test_message)
     
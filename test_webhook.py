@@ -11,6 +11,13 @@ from datetime import datetime
 WEBHOOK_URL = "http://localhost:8000/webhook"
 WEBHOOK_SECRET = "your-secret-key"  # Change this to your actual secret
 
+# Shared session reuses one keep-alive connection across all requests
+SESSION = requests.Session()
+SESSION.headers.update({
+    "Authorization": f"Bearer {WEBHOOK_SECRET}",
+    "Content-Type": "application/json"
+})
+
 def test_entry_long():
     """Test LONG entry signal"""
     payload = {
@@ -25,13 +32,8 @@ def test_entry_long():
         "timestamp": datetime.utcnow().isoformat()
     }
     
-    headers = {
-        "Authorization": f"Bearer {WEBHOOK_SECRET}",
-        "Content-Type": "application/json"
-    }
-    
     print("Testing LONG entry signal...")
-    response = requests.post(WEBHOOK_URL, json=payload, headers=headers)
+    response = SESSION.post(WEBHOOK_URL, json=payload)
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
     print()
@@ -49,13 +51,8 @@ def test_exit_long():
         "timestamp": datetime.utcnow().isoformat()
     }
     
-    headers = {
-        "Authorization": f"Bearer {WEBHOOK_SECRET}",
-        "Content-Type": "application/json"
-    }
-    
     print("Testing LONG exit signal...")
-    response = requests.post(WEBHOOK_URL, json=payload, headers=headers)
+    response = SESSION.post(WEBHOOK_URL, json=payload)
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
     print()
@@ -74,13 +71,8 @@ def test_entry_short():
         "timestamp": datetime.utcnow().isoformat()
     }
     
-    headers = {
-        "Authorization": f"Bearer {WEBHOOK_SECRET}",
-        "Content-Type": "application/json"
-    }
-    
     print("Testing SHORT entry signal...")
-    response = requests.post(WEBHOOK_URL, json=payload, headers=headers)
+    response = SESSION.post(WEBHOOK_URL, json=payload)
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
     print()
@@ -88,7 +80,7 @@ def test_entry_short():
 def test_health():
     """Test health endpoint"""
     print("Testing health endpoint...")
-    response = requests.get("http://localhost:8000/health")
+    response = SESSION.get("http://localhost:8000/health")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
     print()